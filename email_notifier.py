@@ -3,12 +3,12 @@ Email notification system for JIRA-Odoo sync errors
 """
 
 import os
-import smtplib
+import gzip
+import time
+import logging
+import atexit
+import threading
 from datetime import datetime
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.mime.base import MIMEBase
-from email import encoders
 from functools import wraps
 from dotenv import load_dotenv
 
@@ -16,7 +16,25 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+_BANNER = "=" * 50
+
+def _format_timestamp(ts):
+    """Format epoch seconds for email bodies"""
+    return datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S')
+
 class EmailNotifier:
+    # Distinct (type, message, severity) entries kept per session; the rest are lumped together
+    MAX_DISTINCT_ERRORS = 500
+    # Socket timeout and messages sent before a cached SMTP connection is recycled
+    SMTP_TIMEOUT = 30
+    SMTP_MAX_MESSAGES = 100
+    # Cached connections idle longer than this are assumed dropped by the server
+    SMTP_MAX_IDLE = 20
+    # Only the end of the log is inlined in critical emails
+    CRITICAL_LOG_TAIL_BYTES = 64 * 1024
+    
     def __init__(self):
         self.enabled = os.getenv("EMAIL_ENABLED", "false").lower() == "true"
         self.smtp_server = os.getenv("EMAIL_SMTP_SERVER", "smtp.gmail.com")
@@ -24,63 +42,97 @@ class EmailNotifier:
         self.from_email = os.getenv("EMAIL_FROM")
         self.password = os.getenv("EMAIL_PASSWORD")
         self.to_email = os.getenv("EMAIL_TO")
+        # EMAIL_TO may list several comma-separated addresses
+        self.recipients = [addr.strip() for addr in (self.to_email or "").split(",") if addr.strip()]
         self.subject_prefix = os.getenv("EMAIL_SUBJECT_PREFIX", "[JIRA-SYNC]")
+        # Environment is fixed for the life of the process
+        self._configured = self.enabled and all([self.from_email, self.password, self.recipients])
         
-        os.makedirs("logs", exist_ok=True)
-        self.sync_errors = []
+        self.sync_errors = {}
+        self.error_count = 0
         self.sync_start_time = None
+        # collect_error may be called from worker threads
+        self._errors_lock = threading.Lock()
+        
+        self._smtp = None
+        self._smtp_sent = 0
+        self._smtp_last_used = 0.0
+        self._smtp_lock = threading.Lock()
+        atexit.register(self.close_smtp)
     
     def is_configured(self):
         """Check if email is properly configured"""
-        return self.enabled and all([self.from_email, self.password, self.to_email])
+        return self._configured
     
     def start_sync_session(self):
         """Start a new sync session"""
-        self.sync_errors = []
+        self.sync_errors = {}
+        self.error_count = 0
         self.sync_start_time = datetime.now()
-        print(f"📧 Email session started - collecting errors for batch send")
+        logger.debug("Email session started - collecting errors for batch send")
     
     def collect_error(self, error, context=None, severity="normal"):
-        """Collect error for batch sending"""
+        """Collect error for batch sending, counting repeats of the same error once"""
         if not self.is_configured():
             return
+        
+        # Raw epoch seconds; only formatted when the summary email is built
+        timestamp = time.time()
+        error_type = type(error).__name__
+        error_message = str(error)
+        # Identical errors (same type, message and severity) share one entry
+        key = (error_type, error_message[:200], severity)
+        
+        with self._errors_lock:
+            if key not in self.sync_errors and len(self.sync_errors) >= self.MAX_DISTINCT_ERRORS:
+                key = ('Other', 'Further distinct errors (limit reached)', severity)
+                error_message, context = key[1], 'Various'
+            
+            error_info = self.sync_errors.get(key)
+            is_new = error_info is None
+            if is_new:
+                error_info = self.sync_errors[key] = {
+                    'first_seen': timestamp,
+                    'error_type': key[0],
+                    'error_message': error_message,
+                    'context': context or 'None',
+                    'severity': severity,
+                    'count': 0
+                }
             
-        error_info = {
-            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'error_type': type(error).__name__,
-            'error_message': str(error),
-            'context': context or 'None',
-            'severity': severity
-        }
-        
-        self.sync_errors.append(error_info)
-        
-        # Add logging to see what error is being collected
-        print(f"📧 Error collected: {error_info['error_type']} - {error_info['error_message']} ({len(self.sync_errors)} total)")
+            error_info['count'] += 1
+            error_info['last_seen'] = timestamp
+            self.error_count += 1
+            total = self.error_count
+        
+        # Report each distinct error once; repeats are only counted
+        if is_new:
+            logger.info("Error collected: %s - %s (%d total)", error_type, error_message, total)
     
     def send_sync_summary_email(self, sync_stats=None, log_file_path=None):
         """Send consolidated email with all errors from sync session"""
-        print(f"📧 Email check: configured={self.is_configured()}, errors={len(self.sync_errors)}")
+        configured = self.is_configured()
+        logger.debug("Email check: configured=%s, errors=%d", configured, self.error_count)
         
-        if not self.is_configured():
-            print("📧 Email not configured - skipping")
+        if not configured:
+            logger.debug("Email not configured - skipping")
             return
         
         if not self.sync_errors:
-            print("📧 No errors collected - skipping email")
+            logger.debug("No errors collected - skipping email")
             return
         
-        print(f"📧 Sending email for {len(self.sync_errors)} errors")
+        logger.info("Sending email for %d errors (%d distinct)", self.error_count, len(self.sync_errors))
         
-        critical_count = sum(1 for e in self.sync_errors if e['severity'] == 'critical')
+        critical_count = sum(e['count'] for e in self.sync_errors.values() if e['severity'] == 'critical')
         subject = f"{self.subject_prefix} 🚨 CRITICAL ERRORS DETECTED" if critical_count > 0 else f"{self.subject_prefix} ⚠️ ERRORS DETECTED"
         
         body_parts = [
             "🚨 CRITICAL ERRORS DETECTED" if critical_count > 0 else "⚠️ ERRORS DETECTED IN JIRA-ODOO SYNC",
             "",
             "SYNC SUMMARY:",
-            f"• Total Errors: {len(self.sync_errors)}",
-            f"• Critical: {critical_count}, Normal: {len(self.sync_errors) - critical_count}",
+            f"• Total Errors: {self.error_count}",
+            f"• Critical: {critical_count}, Normal: {self.error_count - critical_count}",
         ]
         
         if sync_stats:
@@ -89,6 +141,15 @@ class EmailNotifier:
                 f"• Skipped: {sync_stats.get('skipped', 0)}",
             ])
         
+        body_parts.extend(["", "ERRORS:"])
+        for e in self.sync_errors.values():
+            seen = _format_timestamp(e['first_seen'])
+            if e['count'] > 1:
+                seen += f" - {_format_timestamp(e['last_seen'])}"
+            body_parts.append(
+                f"• [{e['severity']}] {e['error_type']} x{e['count']} ({seen}) - {e['context']}: {e['error_message']}"
+            )
+        
         body_parts.extend([
             "",
             "RECOMMENDED ACTIONS:",
@@ -97,7 +158,10 @@ class EmailNotifier:
         ])
         
         self.send_email_with_attachment(subject, "\n".join(body_parts), log_file_path)
-        self.sync_errors = []
+        # The summary is the last email of a session; don't hold the connection open
+        self.close_smtp()
+        self.sync_errors = {}
+        self.error_count = 0
     
     def send_critical_error_immediate(self, error, context=None, log_file_path=None):
         """Send immediate email for critical system failures with full log"""
@@ -122,15 +186,22 @@ class EmailNotifier:
         
         if log_file_path and os.path.exists(log_file_path):
             try:
-                with open(log_file_path, 'r', encoding='utf-8') as f:
-                    log_content = f.read()
+                with open(log_file_path, 'rb') as f:
+                    size = f.seek(0, os.SEEK_END)
+                    truncated = size > self.CRITICAL_LOG_TAIL_BYTES
+                    f.seek(size - self.CRITICAL_LOG_TAIL_BYTES if truncated else 0)
+                    log_tail = f.read()
+                
+                if truncated:
+                    # Start at a line boundary rather than mid-line
+                    log_tail = log_tail.partition(b"\n")[2]
                 
                 body_parts.extend([
                     "",
-                    "=" * 50,
-                    "FULL SYNC LOG (for debugging):",
-                    "=" * 50,
-                    log_content
+                    _BANNER,
+                    f"SYNC LOG - last {self.CRITICAL_LOG_TAIL_BYTES // 1024} KB (for debugging):" if truncated else "FULL SYNC LOG (for debugging):",
+                    _BANNER,
+                    log_tail.decode('utf-8', errors='replace')
                 ])
             except Exception as e:
                 body_parts.extend([
@@ -139,9 +210,9 @@ class EmailNotifier:
                 ])
 
         if self.send_email(subject, "\n".join(body_parts)):
-            print("📧 ✅ Critical email sent successfully")
+            logger.info("Critical email sent successfully")
         else:
-            print("📧 ❌ Critical email failed to send")
+            logger.error("Critical email failed to send")
     
     def send_email(self, subject, body):
         """Send email via SMTP"""
@@ -149,18 +220,7 @@ class EmailNotifier:
             if not self.is_configured():
                 raise ValueError("Email credentials not configured")
             
-            msg = MIMEText(body, 'plain', 'utf-8')
-            msg['From'] = self.from_email or ""
-            msg['To'] = self.to_email or ""
-            msg['Subject'] = subject
-            
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls()
-                if not self.from_email or not self.password:
-                    raise ValueError("Email credentials (from_email and password) are required")
-                
-                server.login(self.from_email, self.password)
-                server.send_message(msg)
+            self._send_message(subject, body)
             
             return True
         except Exception as e:
@@ -172,47 +232,125 @@ class EmailNotifier:
             if not self.is_configured():
                 raise ValueError("Email credentials not configured")
             
-            # Create multipart message
-            msg = MIMEMultipart()
-            msg['From'] = self.from_email or ""
-            msg['To'] = self.to_email or ""
-            msg['Subject'] = subject
-            
-            # Add body
-            msg.attach(MIMEText(body, 'plain', 'utf-8'))
-            
             # Add attachment if provided
+            attachment = None
             if attachment_path and os.path.exists(attachment_path):
-                with open(attachment_path, 'rb') as attachment:
-                    part = MIMEBase('application', 'octet-stream')
-                    part.set_payload(attachment.read())
-                
-                encoders.encode_base64(part)
-                part.add_header(
-                    'Content-Disposition',
-                    f'attachment; filename= {os.path.basename(attachment_path)}'
-                )
-                msg.attach(part)
+                # Logs compress well - gzip keeps the message (and its base64 copy) small
+                with open(attachment_path, 'rb') as f:
+                    attachment = (os.path.basename(attachment_path) + ".gz", gzip.compress(f.read()))
             
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls()
-                if not self.from_email or not self.password:
-                    raise ValueError("Email credentials (from_email and password) are required")
-                
-                server.login(self.from_email, self.password)
-                server.send_message(msg)
+            self._send_message(subject, body, attachment)
             
-            print("📧 ✅ Email sent successfully")
+            logger.info("Email sent successfully")
             return True
         except Exception as e:
-            print(f"📧 ❌ Email failed: {e}")
+            logger.error("Email failed: %s", e)
             return False
 
+    def _build_message(self, subject, body, attachment=None, eight_bit=False):
+        """Build the outgoing message; 8bit bodies skip base64 encoding when the server allows it"""
+        from email.message import EmailMessage
+        
+        msg = EmailMessage()
+        msg['From'] = self.from_email or ""
+        msg['To'] = ", ".join(self.recipients)
+        msg['Subject'] = subject
+        msg.set_content(body, cte='8bit' if eight_bit else 'base64')
+        
+        if attachment:
+            filename, data = attachment
+            msg.add_attachment(data, maintype='application', subtype='gzip', filename=filename)
+        
+        return msg
+    
+    def _get_smtp(self):
+        """Return the cached SMTP connection if still alive, otherwise connect and log in"""
+        import smtplib
+        
+        if self._smtp is not None and (self._smtp_sent >= self.SMTP_MAX_MESSAGES
+                                       or time.monotonic() - self._smtp_last_used > self.SMTP_MAX_IDLE):
+            self._quit_smtp()
+        
+        if self._smtp is not None:
+            # RSET is a cheap probe that also clears any half-finished transaction
+            try:
+                if self._smtp.rset()[0] == 250:
+                    return self._smtp
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._discard_smtp()
+        
+        if not self.from_email or not self.password:
+            raise ValueError("Email credentials (from_email and password) are required")
+        
+        server = smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=self.SMTP_TIMEOUT)
+        try:
+            server.starttls()
+            server.login(self.from_email, self.password)
+        except Exception:
+            server.close()
+            raise
+        self._smtp = server
+        self._smtp_sent = 0
+        return self._smtp
+    
+    def _send_message(self, subject, body, attachment=None):
+        """Send message over the cached connection, reconnecting once if the server dropped it"""
+        import smtplib
+        
+        # smtplib.SMTP is not thread-safe
+        with self._smtp_lock:
+            try:
+                self._deliver(self._get_smtp(), subject, body, attachment)
+            except (smtplib.SMTPServerDisconnected, ConnectionResetError):
+                self._discard_smtp()
+                self._deliver(self._get_smtp(), subject, body, attachment)
+    
+    def _deliver(self, server, subject, body, attachment=None):
+        """Build the message for this server's capabilities and send it"""
+        # 8bit bodies must still respect the 998-octet SMTP line limit (bytes, not characters)
+        eight_bit = server.has_extn('8bitmime') and all(len(line.encode('utf-8')) <= 998 for line in body.splitlines())
+        msg = self._build_message(subject, body, attachment, eight_bit)
+        # One MAIL/RCPT/DATA transaction for all recipients
+        server.send_message(msg, to_addrs=self.recipients,
+                            mail_options=['BODY=8BITMIME'] if eight_bit else [])
+        self._smtp_sent += 1
+        self._smtp_last_used = time.monotonic()
+    
+    def _discard_smtp(self):
+        """Drop the cached connection without talking to the server"""
+        try:
+            self._smtp.close()
+        except Exception:
+            pass
+        self._smtp = None
+    
+    def _quit_smtp(self):
+        """Politely close the cached connection"""
+        try:
+            self._smtp.quit()
+        except Exception:
+            pass
+        self._smtp = None
+    
+    def close_smtp(self):
+        """Close the cached SMTP connection"""
+        with self._smtp_lock:
+            if self._smtp is not None:
+                self._quit_smtp()
+
 # Global instance
 email_notifier = EmailNotifier()
 
 def email_on_error(severity="normal"):
-    """Decorator to collect errors"""
+    """
+    Decorator to collect errors.
+    Email settings are read once at startup, so when email is not configured
+    functions are returned unwrapped and pay no per-call overhead.
+    """
+    if not email_notifier.is_configured():
+        return lambda func: func
+    
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
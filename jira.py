@@ -3,8 +3,16 @@ JIRA API integration
 Handles fetching JIRA issues and extracting Odoo URLs with Epic hierarchy support
 """
 
+import os
+import re
+import logging
+import time
+import orjson
 import requests
-from utils import config
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from urllib.parse import unquote
+from utils import config, make_session, REQUEST_TIMEOUT
 from email_notifier import email_notifier
 
 # Configuration
@@ -18,79 +26,325 @@ headers = {
     "Accept": "application/json",
     "Content-Type": "application/json"
 }
+# Shared keep-alive session: one TCP/TLS connection pool for all JIRA calls.
+# POST is retried too - it is only used for read-only bulk fetches.
+session = make_session(headers, auth=auth, pool_connections=4, pool_maxsize=16, methods=("GET", "POST"))
+
+# Bulk fetch accepts at most 100 issues per request
+BULK_FETCH_SIZE = 100
+# Concurrent per-issue requests when bulk fetch is unavailable (kept below the session pool size)
+MAX_WORKERS = 8
+# Only the fields we read - full issue payloads carry every custom field
+ISSUE_FIELDS = ["summary", "customfield_10134", "parent", "customfield_10014"]
+EPIC_FIELDS = ["summary", "customfield_10134"]
+
+# Odoo URL parameters, in the query string or the #fragment (anchored so menu_id=/action_id= don't match)
+_ODOO_ID_RE = re.compile(r'(?:^|[?#&])id=([^&#]*)')
+_ODOO_MODEL_RE = re.compile(r'(?:^|[?#&])model=([^&#]+)')
+# Task ID returned by extract_odoo_task_id_from_url for a non-numeric id= value (reported by the caller)
+MALFORMED_TASK_ID = object()
+
+class EpicLookupError(Exception):
+    """The parent Epic could not be fetched - the issue's Odoo URL is unknown, not missing"""
+
+# Issue key -> resolved result of get_issue_with_odoo_url (None = no Odoo URL / not found)
+_issue_cache = {}
+# Issue key -> epoch seconds the entry was fetched (entries restored from disk keep their age)
+_issue_fetched_at = {}
+# Issue ID -> key, learned from bulk fetches and persisted with the issue cache (Tempo worklogs only carry the issue ID)
+_issue_key_by_id = {}
+
+# Resolved issues persisted between runs; issues without an Odoo URL expire sooner so new mappings are picked up
+ISSUE_CACHE_FILE = os.path.join("cache", "jira_issues.json")
+ISSUE_CACHE_TTL = 24 * 3600
+MISSING_URL_CACHE_TTL = 3600
+
+def clear_caches(persistent=False):
+    """Forget cached issue and Epic lookups (call at the start of each sync run); persistent=True also deletes the disk cache"""
+    _issue_cache.clear()
+    _issue_fetched_at.clear()
+    _issue_key_by_id.clear()
+    get_epic_odoo_url.cache_clear()
+    extract_odoo_task_id_from_url.cache_clear()
+    if persistent:
+        try:
+            os.remove(ISSUE_CACHE_FILE)
+        except FileNotFoundError:
+            pass
+
+def load_issue_cache():
+    """Seed the issue cache with unexpired entries from the previous runs"""
+    try:
+        with open(ISSUE_CACHE_FILE, 'rb') as f:
+            entries = orjson.loads(f.read())
+    except FileNotFoundError:
+        return
+    except (OSError, ValueError) as e:
+        # The cache is optional - not a sync error worth an email
+        logging.warning("Ignoring unreadable JIRA issue cache %s: %s", ISSUE_CACHE_FILE, e)
+        return
+    
+    if not isinstance(entries, dict):
+        logging.warning("Ignoring unreadable JIRA issue cache %s: expected a JSON object", ISSUE_CACHE_FILE)
+        return
+    
+    now = time.time()
+    for key, entry in entries.items():
+        # Skip malformed entries (hand-edited or foreign file) rather than failing the sync
+        if not isinstance(entry, dict):
+            continue
+        data = entry.get('data')
+        fetched_at = entry.get('fetched_at', 0)
+        if not isinstance(fetched_at, (int, float)) or not (data is None or isinstance(data, dict)):
+            continue
+        if now - fetched_at < (ISSUE_CACHE_TTL if data else MISSING_URL_CACHE_TTL):
+            _issue_cache[key] = data
+            _issue_fetched_at[key] = fetched_at
+            if entry.get('id'):
+                _issue_key_by_id[str(entry['id'])] = key
+
+def save_issue_cache():
+    """Write the issue cache to disk for the next run"""
+    now = time.time()
+    id_by_key = {key: issue_id for issue_id, key in _issue_key_by_id.items()}
+    entries = {
+        key: {'data': data, 'fetched_at': _issue_fetched_at.get(key, now), 'id': id_by_key.get(key)}
+        for key, data in _issue_cache.items()
+    }
+    try:
+        os.makedirs(os.path.dirname(ISSUE_CACHE_FILE), exist_ok=True)
+        # Write then rename so an interrupted run never leaves a truncated cache
+        tmp_file = ISSUE_CACHE_FILE + ".tmp"
+        with open(tmp_file, 'wb') as f:
+            f.write(orjson.dumps(entries))
+        os.replace(tmp_file, ISSUE_CACHE_FILE)
+    except OSError as e:
+        logging.warning("Could not write JIRA issue cache %s: %s", ISSUE_CACHE_FILE, e)
+
+def _parent_epic_key(fields):
+    """Return the parent Epic key of an issue, if any"""
+    parent_epic = fields.get('parent') or fields.get('customfield_10014')
+    if not parent_epic:
+        return None
+    return parent_epic.get('key') if isinstance(parent_epic, dict) else str(parent_epic)
+
+def _build_issue_data(issue_key, fields, get_epic):
+    """Resolve the Odoo URL of an issue from its own fields or its parent Epic"""
+    issue_title = fields.get('summary', f'Work on {issue_key}')
+    
+    # Check for direct Odoo URL
+    odoo_url = fields.get('customfield_10134', '')
+    if odoo_url:
+        return {
+            'key': issue_key,
+            'odoo_url': odoo_url,
+            'summary': issue_title,
+            'task_source': 'direct',
+            'description': issue_title
+        }
+    
+    # Check parent Epic for Odoo URL
+    epic_key = _parent_epic_key(fields)
+    if epic_key:
+        epic_data = get_epic(epic_key)
+        if epic_data and epic_data.get('odoo_url'):
+            return {
+                'key': issue_key,
+                'odoo_url': epic_data['odoo_url'],
+                'summary': issue_title,
+                'task_source': 'epic',
+                'epic_key': epic_key,
+                'description': issue_title
+            }
+    
+    return None
+
+def _bulk_fetch_issues(issue_keys, fields=ISSUE_FIELDS):
+    """Fetch issue fields for many keys (or IDs) via /issue/bulkfetch; returns {key: fields} or None on failure"""
+    bulk_url = f"{JIRA_URL}/rest/api/3/issue/bulkfetch"
+    issues = {}
+    try:
+        for i in range(0, len(issue_keys), BULK_FETCH_SIZE):
+            payload = {
+                "issueIdsOrKeys": issue_keys[i:i + BULK_FETCH_SIZE],
+                "fields": fields
+            }
+            response = session.post(bulk_url, json=payload, timeout=REQUEST_TIMEOUT)
+            
+            if response.status_code == 401:
+                auth_error = Exception("JIRA API authentication failed")
+                email_notifier.collect_error(auth_error, "JIRA API Authentication Failure", severity="critical")
+                return None
+            
+            response.raise_for_status()
+            
+            # Unknown or inaccessible keys are reported in 'issueErrors' and simply left out
+            for issue in orjson.loads(response.content).get('issues', []):
+                issues[issue['key']] = issue.get('fields', {})
+                _issue_key_by_id[str(issue.get('id'))] = issue['key']
+        
+        return issues
+    
+    except requests.exceptions.RequestException as e:
+        email_notifier.collect_error(e, "JIRA bulk issue fetch failure - falling back to per-issue requests", severity="normal")
+        return None
+    except Exception as e:
+        email_notifier.collect_error(e, "Unexpected error in JIRA bulk issue fetch", severity="normal")
+        return None
+
+def _resolve_fetched_issues(issues):
+    """Cache the Odoo URL resolution of bulk-fetched {key: fields}, fetching the parent Epics they need in one more request"""
+    epic_keys = list(dict.fromkeys(
+        _parent_epic_key(fields) for fields in issues.values()
+        if not fields.get('customfield_10134') and _parent_epic_key(fields)
+    ))
+    epics = {}
+    get_epic = epics.get
+    if epic_keys:
+        epic_fields = _bulk_fetch_issues(epic_keys, EPIC_FIELDS)
+        if epic_fields is None:
+            # Fall back to per-Epic requests; issues whose Epic still fails are left uncached
+            get_epic = get_epic_odoo_url
+        else:
+            epics.update({
+                key: {'key': key, 'odoo_url': fields.get('customfield_10134', ''), 'summary': fields.get('summary', '')}
+                for key, fields in epic_fields.items()
+            })
+    
+    for key, fields in issues.items():
+        try:
+            _issue_cache[key] = _build_issue_data(key, fields, get_epic)
+        except EpicLookupError:
+            continue
+        _issue_fetched_at.pop(key, None)
+
+def get_issues_with_odoo_urls(issue_keys):
+    """
+    Resolve Odoo URLs for many JIRA issues with batched requests:
+    one bulk fetch for the issues and one for the parent Epics they still need.
+    Results are cached for get_issue_with_odoo_url.
+    """
+    keys = [key for key in dict.fromkeys(issue_keys) if key and key not in _issue_cache]
+    if keys:
+        issues = _bulk_fetch_issues(keys)
+        if issues is None:
+            # Bulk fetch unavailable - overlap the per-issue requests instead (they cache what resolves)
+            get_issues_parallel(keys)
+        else:
+            _resolve_fetched_issues(issues)
+            for key in keys:
+                if key not in issues:
+                    # Unknown or inaccessible issue
+                    _issue_cache[key] = None
+    
+    return {key: _issue_cache.get(key) for key in issue_keys if key}
+
+def get_issue_keys_by_id(issue_ids):
+    """
+    Map JIRA issue IDs to keys with bulk fetches; returns {id: key} (unknown IDs left out) or None on failure.
+    The same requests resolve the issues' Odoo URLs, so later lookups by key are cache hits.
+    IDs whose issue is already cached (this run or restored from disk) are not fetched again.
+    """
+    issue_ids = [str(issue_id) for issue_id in issue_ids if issue_id]
+    missing = [
+        issue_id for issue_id in dict.fromkeys(issue_ids)
+        if _issue_key_by_id.get(issue_id) not in _issue_cache
+    ]
+    if missing:
+        issues = _bulk_fetch_issues(missing)
+        if issues is None:
+            return None
+        _resolve_fetched_issues(issues)
+    
+    return {issue_id: _issue_key_by_id[issue_id] for issue_id in issue_ids if issue_id in _issue_key_by_id}
+
+def get_issues_parallel(issue_keys, max_workers=MAX_WORKERS):
+    """Fetch issues with concurrent per-issue requests; returns {key: issue data}"""
+    keys = list(dict.fromkeys(key for key in issue_keys if key))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return dict(zip(keys, executor.map(get_issue_with_odoo_url, keys)))
+
+def _handle_auth_failure(issue_key, response):
+    auth_error = Exception("JIRA API authentication failed")
+    email_notifier.collect_error(auth_error, "JIRA API Authentication Failure", severity="critical")
+    return None
+
+def _handle_missing_issue(issue_key, response):
+    _issue_cache[issue_key] = None
+    return None
+
+def _handle_rate_limit(issue_key, response):
+    # Still throttled after the session's own retries
+    rate_error = Exception(f"JIRA API rate limit exceeded (Retry-After: {response.headers.get('Retry-After', 'n/a')})")
+    email_notifier.collect_error(rate_error, f"JIRA API Rate Limit for {issue_key}", severity="critical")
+    return None
+
+# Expected non-2xx statuses for a single issue fetch; anything else goes through raise_for_status
+_STATUS_HANDLERS = {
+    401: _handle_auth_failure,
+    404: _handle_missing_issue,
+    429: _handle_rate_limit,
+}
 
 def get_issue_with_odoo_url(issue_key):
     """Get JIRA issue and extract Odoo URL from issue or parent Epic"""
+    if issue_key in _issue_cache:
+        return _issue_cache[issue_key]
+    
     try:
         issue_url = f"{JIRA_URL}/rest/api/3/issue/{issue_key}"
-        response = requests.get(issue_url, headers=headers, auth=auth)
-        
-        # Handle authentication failure
-        if response.status_code == 401:
-            auth_error = Exception("JIRA API authentication failed")
-            email_notifier.collect_error(auth_error, "JIRA API Authentication Failure", severity="critical")
-            return None
+        response = session.get(issue_url, params={"fields": ",".join(ISSUE_FIELDS)}, timeout=REQUEST_TIMEOUT)
         
-        # Handle missing issue
-        if response.status_code == 404:
-            return None
+        handler = _STATUS_HANDLERS.get(response.status_code)
+        if handler:
+            return handler(issue_key, response)
             
         response.raise_for_status()
         
-        issue_data = response.json()
+        issue_data = orjson.loads(response.content)
         fields = issue_data.get('fields', {})
-        issue_title = fields.get('summary', f'Work on {issue_key}')
-        
-        # Check for direct Odoo URL
-        odoo_url = fields.get('customfield_10134', '')
-        if odoo_url:
-            return {
-                'key': issue_key,
-                'odoo_url': odoo_url,
-                'summary': issue_title,
-                'task_source': 'direct',
-                'description': issue_title
-            }
         
-        # Check parent Epic for Odoo URL
-        parent_epic = fields.get('parent') or fields.get('customfield_10014')
-        if parent_epic:
-            epic_key = parent_epic.get('key') if isinstance(parent_epic, dict) else str(parent_epic)
+        # Only resolved lookups are cached; failed requests are retried on the next call
+        result = _issue_cache[issue_key] = _build_issue_data(issue_key, fields, get_epic_odoo_url)
+        return result
             
-            epic_data = get_epic_odoo_url(epic_key)
-            if epic_data and epic_data.get('odoo_url'):
-                return {
-                    'key': issue_key,
-                    'odoo_url': epic_data['odoo_url'],
-                    'summary': issue_title,
-                    'task_source': 'epic',
-                    'epic_key': epic_key,
-                    'description': issue_title
-                }
-        
-        return None
-            
-    except requests.exceptions.ConnectionError as e:
-        email_notifier.collect_error(e, f"JIRA API Connection Failure for {issue_key}", severity="critical")
-        return None
-    except requests.exceptions.Timeout as e:
-        email_notifier.collect_error(e, f"JIRA API Timeout for {issue_key}", severity="critical")
+    except EpicLookupError:
+        # Already reported by get_epic_odoo_url
         return None
     except requests.exceptions.RequestException as e:
-        email_notifier.collect_error(e, f"JIRA API Request Failure for {issue_key}", severity="critical")
+        if isinstance(e, requests.exceptions.ConnectionError):
+            failure = "Connection Failure"
+        elif isinstance(e, requests.exceptions.Timeout):
+            failure = "Timeout"
+        else:
+            failure = "Request Failure"
+        email_notifier.collect_error(e, f"JIRA API {failure} for {issue_key}", severity="critical")
         return None
     except Exception as e:
         email_notifier.collect_error(e, f"Unexpected error fetching {issue_key}", severity="normal")
         return None
 
+@lru_cache(maxsize=4096)
 def get_epic_odoo_url(epic_key):
-    """Get Epic details including Odoo URL"""
+    """
+    Get Epic details including Odoo URL (cached - many issues share one Epic; treat the result as read-only).
+    Returns None when the Epic has no Odoo URL; raises EpicLookupError when it could not be fetched,
+    which lru_cache does not memoize, so the next lookup tries again.
+    """
     try:
         epic_url = f"{JIRA_URL}/rest/api/3/issue/{epic_key}"
-        response = requests.get(epic_url, headers=headers, auth=auth)
+        response = session.get(epic_url, params={"fields": ",".join(EPIC_FIELDS)}, timeout=REQUEST_TIMEOUT)
+        
+        # Deleted or inaccessible Epic - the issue simply has no inherited Odoo URL
+        if response.status_code == 404:
+            return None
+        if response.status_code in (401, 429):
+            _STATUS_HANDLERS[response.status_code](epic_key, response)
+            raise EpicLookupError(f"Epic fetch failed for {epic_key} (HTTP {response.status_code})")
+        
         response.raise_for_status()
         
-        epic_data = response.json()
+        epic_data = orjson.loads(response.content)
         fields = epic_data.get('fields', {})
         odoo_url = fields.get('customfield_10134', '')
         
@@ -103,44 +357,41 @@ def get_epic_odoo_url(epic_key):
         
         return None
         
+    except EpicLookupError:
+        raise
     except Exception as e:
         email_notifier.collect_error(e, f"Epic fetch failure for {epic_key}", severity="normal")
-        return None
+        raise EpicLookupError(f"Epic fetch failed for {epic_key}") from e
 
+@lru_cache(maxsize=4096)
 def extract_odoo_task_id_from_url(odoo_url):
-    """Extract Odoo task ID and model type from URL"""
+    """
+    Extract Odoo task ID and model type from URL (cached - worklogs on one task share its URL).
+    A non-numeric id= yields MALFORMED_TASK_ID; reporting is left to the caller so it happens per worklog.
+    """
     if not odoo_url:
         return None, None
     
-    try:
-        task_id = None
-        model_type = 'project.task'  # Default
-        
-        # Extract ID from URL
-        if 'id=' in str(odoo_url):
-            task_id = str(odoo_url).split('id=')[1].split('&')[0]
-            task_id = int(task_id)
-        
-        if task_id is None:
-            return None, None
-        
-        # Extract model type
-        if 'model=' in str(odoo_url):
-            model_part = str(odoo_url).split('model=')[1].split('&')[0]
-            model_type = model_part.replace('%2E', '.')  # Handle URL encoding
-        
-        return task_id, model_type
-        
-    except (ValueError, IndexError) as e:
-        url_error = Exception(f"Malformed Odoo URL: {odoo_url}")
-        email_notifier.collect_error(url_error, "Malformed Odoo URL in JIRA issue", severity="normal")
+    odoo_url = str(odoo_url)
+    id_match = _ODOO_ID_RE.search(odoo_url)
+    if id_match is None:
         return None, None
+    
+    try:
+        task_id = int(unquote(id_match.group(1)))
+    except ValueError:
+        return MALFORMED_TASK_ID, None
+    
+    model_match = _ODOO_MODEL_RE.search(odoo_url)
+    model_type = unquote(model_match.group(1)) if model_match else 'project.task'  # Default
+    
+    return task_id, model_type
 
 def test_jira_connection():
     """Test JIRA API connection"""
     try:
         user_url = f"{JIRA_URL}/rest/api/3/myself"
-        user_response = requests.get(user_url, headers=headers, auth=auth)
+        user_response = session.get(user_url, timeout=REQUEST_TIMEOUT)
         user_response.raise_for_status()
         
         current_user = user_response.json()
@@ -7,65 +7,93 @@ Main script that syncs Tempo worklogs to Odoo
 
 import sys
 import logging
-import math
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from datetime import datetime
 from utils import SyncSession, config
-from tempo import get_tempo_worklogs, enrich_worklogs_with_issue_key
-from jira import get_issue_with_odoo_url, extract_odoo_task_id_from_url
-from odoo import create_timesheet_entry, check_existing_worklogs_by_worklog_id, test_odoo_connection
+from tempo import iter_tempo_worklog_pages, enrich_worklogs_with_issue_keys, test_tempo_connection
+from jira import get_issue_with_odoo_url, get_issues_with_odoo_urls, extract_odoo_task_id_from_url, MALFORMED_TASK_ID, clear_caches, load_issue_cache, save_issue_cache
+from odoo import prepare_timesheet_entry, create_timesheet_entries, check_existing_worklogs_by_worklog_id, find_existing_worklog_ids, test_odoo_connection
 from email_notifier import email_notifier, email_on_error
 
 def convert_seconds_to_hours(seconds):
     """Convert seconds to hours, rounded UP to the nearest 0.25"""
     if seconds <= 0:
         return 0.0
-    hours = seconds / 3600
-    return round(math.ceil(hours * 4) / 4, 2)
+    # Ceiling division by the 900 s (0.25 h) quantum
+    return -(-seconds // 900) * 0.25
 
 
-def sync_tempo_worklogs_to_odoo(worklog):
-    """Sync single Tempo worklog to Odoo"""
+def dedupe_worklogs(worklogs, seen_ids=None):
+    """Drop repeated Tempo worklog IDs (e.g. page overlap), keeping the first occurrence; seen_ids spans pages"""
+    if seen_ids is None:
+        seen_ids = set()
+    unique = []
+    for worklog in worklogs:
+        tempo_worklog_id = worklog.get('tempoWorklogId')
+        if tempo_worklog_id in seen_ids:
+            continue
+        if tempo_worklog_id:
+            seen_ids.add(tempo_worklog_id)
+        unique.append(worklog)
+    return unique
+
+
+def _get_jira_key(worklog):
+    """JIRA issue key of a worklog, or None when the issue is missing or null"""
+    issue = worklog.get('issue')
+    return issue.get('key') if issue else None
+
+
+def prepare_worklog_entry(worklog, existing_worklog_ids=None):
+    """
+    Resolve a Tempo worklog into Odoo timesheet values without writing anything.
+    Returns (jira_key, values) or None when the worklog is skipped.
+    existing_worklog_ids: prefetched synced IDs, skips the per-worklog duplicate check.
+    """
     tempo_worklog_id = worklog.get('tempoWorklogId')
-    issue = worklog.get('issue', {})
-    
-    if issue is None:
-        issue = {}
-    
-    jira_key = issue.get('key')
+    jira_key = _get_jira_key(worklog)
     
     try:
-        logging.info(f"Processing worklog: JIRA {jira_key}, Tempo ID: {tempo_worklog_id}")
+        logging.info("Processing worklog: JIRA %s, Tempo ID: %s", jira_key, tempo_worklog_id)
+        
+        if existing_worklog_ids is not None:
+            is_duplicate = str(tempo_worklog_id) in existing_worklog_ids
+        else:
+            is_duplicate = bool(tempo_worklog_id) and check_existing_worklogs_by_worklog_id(tempo_worklog_id)
         
-        if tempo_worklog_id and check_existing_worklogs_by_worklog_id(tempo_worklog_id):
-            logging.info(f"SKIPPED: Duplicate worklog - Tempo ID {tempo_worklog_id}")
-            return False
+        if is_duplicate:
+            logging.info("SKIPPED: Duplicate worklog - Tempo ID %s", tempo_worklog_id)
+            return None
         
         issue_data = get_issue_with_odoo_url(jira_key)
         if not issue_data or not issue_data.get('odoo_url'):
-            logging.warning(f"SKIPPED: No Odoo URL found for {jira_key}")
+            logging.warning("SKIPPED: No Odoo URL found for %s", jira_key)
             missing_url_error = Exception(f"SKIPPED: No Odoo URL found for JIRA issue {jira_key}")
             email_notifier.collect_error(missing_url_error, f"Missing Odoo URL mapping for {jira_key}", severity="warning")
-            return False
+            return None
         
         odoo_task_id, model = extract_odoo_task_id_from_url(issue_data['odoo_url'])
+        if odoo_task_id is MALFORMED_TASK_ID:
+            url_error = Exception(f"Malformed Odoo URL: {issue_data['odoo_url']}")
+            email_notifier.collect_error(url_error, "Malformed Odoo URL in JIRA issue", severity="normal")
+            odoo_task_id = None
         if not odoo_task_id:
-            logging.error(f"SKIPPED: Could not extract task ID from Odoo URL for {jira_key}")
+            logging.error("SKIPPED: Could not extract task ID from Odoo URL for %s", jira_key)
             invalid_url_error = Exception(f"SKIPPED: Could not extract task ID from Odoo URL for {jira_key}")
             email_notifier.collect_error(invalid_url_error, f"Invalid Odoo URL format for {jira_key}", severity="critical")
-            return False
+            return None
         
         time_seconds = worklog.get('timeSpentSeconds', 0)
         hours = convert_seconds_to_hours(time_seconds)
         
-        logging.info(f"Creating timesheet: {hours}h for {model} ID {odoo_task_id}")
+        logging.info("Creating timesheet: %sh for %s ID %s", hours, model, odoo_task_id)
         
         # Extract Jira author from worklog
-        jira_author = (
-            worklog.get('author')
-            or (worklog.get('issue', {}).get('fields', {}).get('assignee') if worklog.get('issue') else None)
-        )
+        issue = worklog.get('issue')
+        jira_author = worklog.get('author') or (issue.get('fields', {}).get('assignee') if issue else None)
         
-        worklog_id = create_timesheet_entry(
+        entry = prepare_timesheet_entry(
             odoo_task_id, 
             hours, 
             f"Arbeit an Aufgabe: {issue_data.get('summary', jira_key)}",
@@ -75,52 +103,105 @@ def sync_tempo_worklogs_to_odoo(worklog):
             jira_author=jira_author
         )
         
-        if worklog_id:
-            odoo_base_url = config["odoo"]["url"].rstrip('/')
-            odoo_task_url = f"{odoo_base_url}/web#id={odoo_task_id}&model={model or 'project.task'}&view_type=form"
-            logging.info(f"SUCCESS: Created timesheet ID {worklog_id} for {jira_key} - Odoo Task: {odoo_task_url}")
-            return True
-        else:
-            logging.error(f"SKIPPED: Failed to create timesheet for {jira_key}")
-            return False
+        if not entry:
+            logging.error("SKIPPED: Could not prepare timesheet for %s", jira_key)
+            return None
+        
+        return jira_key, entry
             
     except Exception as e:
-        logging.error(f"ERROR: System exception processing worklog {jira_key}: {e}")
+        logging.error("ERROR: System exception processing worklog %s: %s", jira_key, e)
         email_notifier.collect_error(e, f"System failure processing worklog {jira_key}", severity="critical")
-        return False
+        return None
+
+
+def create_worklog_entries(prepared):
+    """Create prepared timesheet entries in bulk; returns the number created"""
+    created_ids = create_timesheet_entries([entry for _, entry in prepared])
+    odoo_base_url = config["odoo"]["url"].rstrip('/')
+    
+    created = 0
+    for (jira_key, entry), worklog_id in zip(prepared, created_ids):
+        if worklog_id:
+            logging.info("SUCCESS: Created timesheet ID %s for %s - Odoo Task: %s/web#id=%s&model=project.task&view_type=form",
+                         worklog_id, jira_key, odoo_base_url, entry['task_id'])
+            created += 1
+        else:
+            logging.error("SKIPPED: Failed to create timesheet for %s", jira_key)
+    return created
+
+def sync_worklog_page(tempo_worklogs, seen_ids, executor):
+    """Sync one page of Tempo worklogs; returns (created, skipped)"""
+    tempo_worklogs = dedupe_worklogs(tempo_worklogs, seen_ids)
+    
+    # Nothing to book for worklogs without time - drop them before any RPC
+    timed_worklogs = []
+    for worklog in tempo_worklogs:
+        if (worklog.get('timeSpentSeconds') or 0) > 0:
+            timed_worklogs.append(worklog)
+        else:
+            logging.info("SKIPPED: No time logged - Tempo ID %s", worklog.get('tempoWorklogId'))
+    
+    # One Odoo query for all already-synced IDs instead of a search per worklog (None = check individually).
+    # Known duplicates are dropped here, before any JIRA work is spent on them.
+    existing_worklog_ids = find_existing_worklog_ids(w.get('tempoWorklogId') for w in timed_worklogs)
+    new_worklogs = []
+    for worklog in timed_worklogs:
+        tempo_worklog_id = worklog.get('tempoWorklogId')
+        if existing_worklog_ids and str(tempo_worklog_id) in existing_worklog_ids:
+            logging.info("SKIPPED: Duplicate worklog - Tempo ID %s", tempo_worklog_id)
+        else:
+            new_worklogs.append(worklog)
+    early_skip_count = len(tempo_worklogs) - len(new_worklogs)
+    
+    # Issue IDs -> keys in bulk; this also resolves most issues' Odoo URLs
+    enriched_worklogs = enrich_worklogs_with_issue_keys(new_worklogs)
+    
+    logging.info("Enriched %d worklogs with JIRA data", len(enriched_worklogs))
+    
+    # Resolve Odoo URLs for all issues in batched requests instead of one GET per worklog
+    get_issues_with_odoo_urls([_get_jira_key(w) for w in enriched_worklogs])
+    
+    prepare_entry = partial(prepare_worklog_entry, existing_worklog_ids=existing_worklog_ids)
+    
+    # Resolving each worklog is independent and dominated by JIRA/Odoo round-trips - overlap them
+    prepared = [p for p in executor.map(prepare_entry, enriched_worklogs) if p]
+    
+    # Write all timesheets with one create call instead of one per worklog
+    created = create_worklog_entries(prepared)
+    return created, early_skip_count + len(enriched_worklogs) - created
 
 @email_on_error(severity="critical")
 def main():
     """Main synchronization function"""
-    with SyncSession():
-        tempo_worklogs = get_tempo_worklogs()
-        logging.info(f"Fetched {len(tempo_worklogs)} worklogs from Tempo")
+    with SyncSession() as session:
+        clear_caches()
+        load_issue_cache()
+        fetched_count = sync_count = skip_count = error_count = 0
+        seen_ids = set()
         
-        enriched_worklogs = []
-        for worklog in tempo_worklogs:
-            enriched = enrich_worklogs_with_issue_key(worklog)
-            if enriched:
-                enriched_worklogs.append(enriched)
+        # Process Tempo page by page so memory stays bounded by the page size, not the lookback window
+        with ThreadPoolExecutor(max_workers=config["sync"]["max_workers"]) as executor:
+            for page in iter_tempo_worklog_pages():
+                logging.info("Fetched %d worklogs from Tempo", len(page))
+                created, skipped = sync_worklog_page(page, seen_ids, executor)
+                fetched_count += len(page)
+                sync_count += created
+                skip_count += skipped
         
-        logging.info(f"Enriched {len(enriched_worklogs)} worklogs with JIRA data")
+        save_issue_cache()
         
-        sync_count = skip_count = error_count = 0
-        
-        for worklog in enriched_worklogs:
-            if sync_tempo_worklogs_to_odoo(worklog):
-                sync_count += 1
-            else:
-                skip_count += 1
-        
-        logging.info(f"Sync completed: {sync_count} created, {skip_count} skipped, {error_count} errors")
+        logging.info("Sync completed: %d created, %d skipped, %d errors (%d worklogs fetched)",
+                     sync_count, skip_count, error_count, fetched_count)
         
         sync_stats = {
             'created': sync_count,
             'skipped': skip_count, 
             'errors': error_count
         }
-        email_notifier.send_sync_summary_email(sync_stats, 
-                                            getattr(logging.getLogger().handlers[0], 'baseFilename', None))
+    
+    # Sent after the session so the attached log file has been fully written
+    email_notifier.send_sync_summary_email(sync_stats, session.log_file)
 
 def test_connections():
     """Test connections to all external services"""
@@ -128,15 +209,18 @@ def test_connections():
     
     test_odoo_connection()
     
-    worklogs = get_tempo_worklogs()
-    if worklogs is not None:
-        print(f"✅ Tempo connection successful ({len(worklogs)} worklogs retrieved)")
+    # Reachability probe only - a full worklog fetch is left to the real sync
+    if test_tempo_connection():
+        print("✅ Tempo connection successful")
     else:
         print("❌ Tempo connection failed")
 
 if __name__ == "__main__":
     if len(sys.argv) > 1 and sys.argv[1] == "--test":
         test_connections()
+    elif len(sys.argv) > 1 and sys.argv[1] == "--clear-cache":
+        clear_caches(persistent=True)
+        print("🧹 JIRA issue cache cleared")
     else:
         main()
 
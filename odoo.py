@@ -5,6 +5,7 @@ Handles connection to Odoo and worklog creation with dynamic employee mapping
 
 import os
 import socket
+import threading
 import xmlrpc.client
 from xmlrpc.client import Fault, ProtocolError
 from datetime import date
@@ -25,12 +26,27 @@ FALLBACK_EMPLOYEE_ID = int((os.getenv("ODOO_FALLBACK_EMPLOYEE_ID", "0") or "0").
 
 
 class OdooClient:
+    # Worklog IDs per search_read in the bulk duplicate check
+    DUPLICATE_CHECK_CHUNK = 1000
+    # Timesheet rows per XML-RPC create call
+    TIMESHEET_CREATE_CHUNK = 500
+
     def __init__(self):
         self.common = None
-        self.models = None
         self.uid = None
         self.connected = False
         self._employee_cache = {}
+        self._connect_lock = threading.Lock()
+        # ServerProxy shares one HTTP connection and is not thread-safe - one per thread
+        self._local = threading.local()
+
+    @property
+    def models(self):
+        """Object endpoint proxy for the calling thread (None until connected)"""
+        models = getattr(self._local, 'models', None)
+        if models is None and self.connected:
+            models = self._local.models = xmlrpc.client.ServerProxy(f'{ODOO_URL}/xmlrpc/2/object')
+        return models
 
     # ---------------------------
     # Connection
@@ -39,27 +55,29 @@ class OdooClient:
         """Establish Odoo connection"""
         if self.connected:
             return True
-        try:
-            self.common = xmlrpc.client.ServerProxy(f'{ODOO_URL}/xmlrpc/2/common')
-            self.models = xmlrpc.client.ServerProxy(f'{ODOO_URL}/xmlrpc/2/object')
-            self.uid = self.common.authenticate(ODOO_DB, ODOO_USERNAME, ODOO_PASSWORD, {})
-            if not self.uid:
-                email_notifier.collect_error(
-                    Exception("Odoo authentication failed - invalid credentials"),
-                    "Odoo Authentication Failure",
-                    severity="critical"
-                )
-                return False
-            self.connected = True
-            return True
+        with self._connect_lock:
+            if self.connected:
+                return True
+            try:
+                self.common = xmlrpc.client.ServerProxy(f'{ODOO_URL}/xmlrpc/2/common')
+                self.uid = self.common.authenticate(ODOO_DB, ODOO_USERNAME, ODOO_PASSWORD, {})
+                if not self.uid:
+                    email_notifier.collect_error(
+                        Exception("Odoo authentication failed - invalid credentials"),
+                        "Odoo Authentication Failure",
+                        severity="critical"
+                    )
+                    return False
+                self.connected = True
+                return True
 
-    # Catch transport/protocol explicitly to get clearer alerts
-        except (ProtocolError, Fault, socket.error, ConnectionError) as e:
-            email_notifier.collect_error(e, "Odoo Connection/Protocol Failure", severity="critical")
-            return False
-        except Exception as e:
-            email_notifier.collect_error(e, "Odoo System Error", severity="critical")
-            return False
+        # Catch transport/protocol explicitly to get clearer alerts
+            except (ProtocolError, Fault, socket.error, ConnectionError) as e:
+                email_notifier.collect_error(e, "Odoo Connection/Protocol Failure", severity="critical")
+                return False
+            except Exception as e:
+                email_notifier.collect_error(e, "Odoo System Error", severity="critical")
+                return False
 
     # ---------------------------
     # Employee resolution
@@ -135,6 +153,30 @@ class OdooClient:
         Create timesheet entry in Odoo (project.task).
         If employee_id is not given, resolve from jira_author; otherwise fallback if configured.
         """
+        worklog_data = self.prepare_timesheet_entry(
+            task_id, hours, description, work_date, tempo_worklog_id, model_type,
+            jira_author=jira_author, employee_id=employee_id
+        )
+        if worklog_data is None:
+            return None
+        return self._create_timesheet_line(worklog_data)
+
+    def prepare_timesheet_entry(
+        self,
+        task_id: int,
+        hours: float,
+        description: str,
+        work_date: Optional[str] = None,
+        tempo_worklog_id: Optional[str] = None,
+        model_type: str = 'project.task',
+        *,
+        jira_author: Any = None,
+        employee_id: Optional[int] = None
+    ) -> Optional[dict]:
+        """
+        Build account.analytic.line values for a timesheet entry without creating it.
+        Returns None (after collecting the error) when the entry cannot be created.
+        """
         if not self.connect() or not self.models:
             email_notifier.collect_error(
                 Exception("Odoo models not available"),
@@ -152,7 +194,7 @@ class OdooClient:
             )
 
         if work_date is None:
-            work_date = date.today().strftime('%Y-%m-%d')
+            work_date = date.today().isoformat()
 
         emp_id = employee_id or self.resolve_employee_id(jira_author)
         if not emp_id:
@@ -202,6 +244,64 @@ class OdooClient:
             if tempo_worklog_id:
                 worklog_data['x_jira_worklog_id'] = str(tempo_worklog_id)
 
+            return worklog_data
+
+        except (ProtocolError, Fault, socket.error, ConnectionError) as e:
+            email_notifier.collect_error(e, "Odoo connection error during timesheet creation", severity="critical")
+            return None
+        except Exception as e:
+            msg = str(e).lower()
+            if any(k in msg for k in ['permission', 'access', 'denied', 'forbidden']):
+                email_notifier.collect_error(e, "Odoo permission error during timesheet creation", severity="critical")
+            else:
+                email_notifier.collect_error(e, "Odoo error during timesheet creation", severity="critical")
+            return None
+
+    def create_timesheet_entries(self, entries: list) -> list:
+        """
+        Create prepared timesheet entries with one XML-RPC create per chunk.
+        Returns the new IDs in input order (None for rows that failed).
+        """
+        if not entries:
+            return []
+        if not self.connect() or not self.models:
+            email_notifier.collect_error(
+                Exception("Odoo models not available"),
+                "Odoo models unavailable during timesheet creation",
+                severity="critical"
+            )
+            return [None] * len(entries)
+
+        created = []
+        for i in range(0, len(entries), self.TIMESHEET_CREATE_CHUNK):
+            chunk = entries[i:i + self.TIMESHEET_CREATE_CHUNK]
+            try:
+                result = self.models.execute_kw(
+                    ODOO_DB, self.uid, ODOO_PASSWORD,
+                    'account.analytic.line', 'create',
+                    [chunk]
+                )
+                if isinstance(result, list) and len(result) == len(chunk):
+                    created.extend(int(r) if isinstance(r, int) else None for r in result)
+                else:
+                    email_notifier.collect_error(
+                        Exception(f"Unexpected create result for {len(chunk)} timesheets: {result!r}"),
+                        "Odoo error during timesheet creation",
+                        severity="critical"
+                    )
+                    created.extend([None] * len(chunk))
+            except Fault:
+                # The batch is one transaction - a single invalid row rejects it, so retry row by row
+                created.extend(self._create_timesheet_line(vals) for vals in chunk)
+            except (ProtocolError, socket.error, ConnectionError) as e:
+                # Outcome unknown - retrying could create duplicates
+                email_notifier.collect_error(e, "Odoo connection error during timesheet creation", severity="critical")
+                created.extend([None] * len(chunk))
+        return created
+
+    def _create_timesheet_line(self, worklog_data: dict) -> Optional[int]:
+        """Create a single prepared timesheet entry"""
+        try:
             result = self.models.execute_kw(
                 ODOO_DB, self.uid, ODOO_PASSWORD,
                 'account.analytic.line', 'create',
@@ -239,6 +339,30 @@ class OdooClient:
         except Exception:
             return False
 
+    def find_existing_worklog_ids(self, tempo_worklog_ids) -> Optional[set]:
+        """Return the subset of Tempo worklog IDs already synced (one search_read per chunk); None on failure"""
+        ids = list(dict.fromkeys(str(i) for i in tempo_worklog_ids if i))
+        if not ids:
+            return set()
+        if not self.connect() or not self.models:
+            return None
+        existing = set()
+        try:
+            for i in range(0, len(ids), self.DUPLICATE_CHECK_CHUNK):
+                records = self.models.execute_kw(
+                    ODOO_DB, self.uid, ODOO_PASSWORD,
+                    'account.analytic.line', 'search_read',
+                    [[('x_jira_worklog_id', 'in', ids[i:i + self.DUPLICATE_CHECK_CHUNK])]],
+                    {'fields': ['x_jira_worklog_id']}
+                )
+                existing.update(str(r['x_jira_worklog_id']) for r in records if r.get('x_jira_worklog_id'))
+            return existing
+        except (ProtocolError, Fault, socket.error, ConnectionError) as e:
+            email_notifier.collect_error(e, "Odoo error during bulk duplicate check", severity="normal")
+            return None
+        except Exception:
+            return None
+
 # Global instance
 odoo_client = OdooClient()
 
@@ -246,8 +370,17 @@ odoo_client = OdooClient()
 def create_timesheet_entry(*args, **kwargs):
     return odoo_client.create_timesheet_entry(*args, **kwargs)
 
+def prepare_timesheet_entry(*args, **kwargs):
+    return odoo_client.prepare_timesheet_entry(*args, **kwargs)
+
+def create_timesheet_entries(*args, **kwargs):
+    return odoo_client.create_timesheet_entries(*args, **kwargs)
+
 def check_existing_worklogs_by_worklog_id(*args, **kwargs):
     return odoo_client.check_existing_worklogs_by_worklog_id(*args, **kwargs)
 
+def find_existing_worklog_ids(*args, **kwargs):
+    return odoo_client.find_existing_worklog_ids(*args, **kwargs)
+
 def test_odoo_connection():
     return odoo_client.connect()
@@ -3,15 +3,18 @@ Tempo API integration
 Handles fetching worklogs from Tempo and enriching them with JIRA data
 """
 
+import orjson
 import requests
 import datetime
-from utils import config
+from utils import config, make_session, REQUEST_TIMEOUT
 from email_notifier import email_notifier
 
 # Configuration
 TEMPO_BASE_URL = "https://api.tempo.io/4"
 TEMPO_API_TOKEN = config["tempo"]["api_token"]
 LOOKBACK_HOURS = config["sync"]["lookback_hours"]
+# Worklogs per Tempo page; the sync processes one page at a time
+PAGE_SIZE = 1000
 
 # Headers
 headers = {
@@ -20,8 +23,11 @@ headers = {
     "Content-Type": "application/json"
 }
 
-def get_tempo_worklogs():
-    """Fetch worklogs from Tempo API"""
+# Keep-alive session so consecutive pages reuse one TLS connection
+session = make_session(headers)
+
+def iter_tempo_worklog_pages():
+    """Yield worklogs from Tempo API one page at a time, following metadata.next"""
     try:
         # Calculate date range
         end_date = datetime.datetime.now()
@@ -32,36 +38,67 @@ def get_tempo_worklogs():
         params = {
             'from': start_date.strftime('%Y-%m-%d'),
             'to': end_date.strftime('%Y-%m-%d'),
-            'limit': 1000
+            'limit': PAGE_SIZE
         }
 
-        response = requests.get(url, headers=headers, params=params)
-        
-        if response.status_code == 401:
-            auth_error = Exception("Tempo API authentication failed - 401 Unauthorized")
-            email_notifier.collect_error(auth_error, "Tempo API Authentication Failure", severity="critical")
-            return []
-        
-        response.raise_for_status()
-        
-        data = response.json()
-        worklogs = data.get('results', [])
-        
-        return worklogs
+        while url:
+            response = session.get(url, params=params, timeout=REQUEST_TIMEOUT)
+            
+            if response.status_code == 401:
+                auth_error = Exception("Tempo API authentication failed - 401 Unauthorized")
+                email_notifier.collect_error(auth_error, "Tempo API Authentication Failure", severity="critical")
+                return
+            
+            response.raise_for_status()
+            
+            data = orjson.loads(response.content)
+            yield data.get('results', [])
+            
+            # The next-page URL already carries the query (from/to/offset/limit)
+            url = (data.get('metadata') or {}).get('next')
+            params = None
         
     except requests.exceptions.RequestException as e:
         email_notifier.collect_error(e, "Tempo API Request Failure", severity="critical")
-        return []
     except Exception as e:
         email_notifier.collect_error(e, "Tempo API Unexpected Error", severity="critical")
-        return []
-
 
+def test_tempo_connection():
+    """Test Tempo API connection with a single-worklog request"""
+    try:
+        response = session.get(f"{TEMPO_BASE_URL}/worklogs", params={'limit': 1}, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        return True
+        
+    except requests.exceptions.RequestException as e:
+        return False
+
+def enrich_worklogs_with_issue_keys(worklogs):
+    """Enrich many worklogs with JIRA issue keys, resolving their issue IDs in bulk"""
+    from jira import get_issue_keys_by_id
+    
+    keys_by_id = get_issue_keys_by_id(
+        (worklog.get('issue') or {}).get('id') for worklog in worklogs
+        if not (worklog.get('issue') or {}).get('key')
+    )
+    if keys_by_id is None:
+        # Bulk fetch unavailable - resolve each worklog on its own
+        return [enriched for enriched in map(enrich_worklogs_with_issue_key, worklogs) if enriched]
+    
+    enriched_worklogs = []
+    for worklog in worklogs:
+        issue = worklog.get('issue') or {}
+        issue_key = issue.get('key') or keys_by_id.get(str(issue.get('id')))
+        # IDs missing from the bulk response are deleted or inaccessible issues
+        if issue_key:
+            enriched_worklogs.append({**worklog, 'issue': {**issue, 'key': issue_key}})
+    
+    return enriched_worklogs
 
 def enrich_worklogs_with_issue_key(worklog):
     """Enrich worklog with JIRA issue key"""
     try:
-        from jira import JIRA_URL, auth, headers as jira_headers
+        from jira import JIRA_URL, session as jira_session
         
         # Get issue ID from worklog
         issue = worklog.get('issue', {})
@@ -76,10 +113,16 @@ def enrich_worklogs_with_issue_key(worklog):
         
         # Fetch issue details from JIRA
         issue_url = f"{JIRA_URL}/rest/api/3/issue/{issue_id}"
-        response = requests.get(issue_url, headers=jira_headers, auth=auth)
+        # Only the key is needed; ask for one small field instead of the full payload
+        response = jira_session.get(issue_url, params={"fields": "summary"}, timeout=REQUEST_TIMEOUT)
+        
+        # Issue deleted since the worklog was written - nothing to sync it to
+        if response.status_code == 404:
+            return None
+        
         response.raise_for_status()
         
-        issue_data = response.json()
+        issue_data = orjson.loads(response.content)
         issue_key = issue_data.get('key')
         
         # Enrich the worklog
@@ -92,6 +135,7 @@ def enrich_worklogs_with_issue_key(worklog):
         email_notifier.collect_error(e, "JIRA API Failure during enrichment", severity="critical")
         return None
     except Exception as e:
+        email_notifier.collect_error(e, "Unexpected error during worklog enrichment", severity="normal")
         return None
 
 
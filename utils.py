@@ -4,10 +4,15 @@ Handles environment variables, logging, and validation
 """
 
 import os
+import queue
+import atexit
 import logging
-import glob
+import logging.handlers
+import requests
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # Load environment variables
 load_dotenv()
@@ -29,7 +34,9 @@ config = {
         "password": os.getenv("ODOO_PASSWORD")
     },
     "sync": {
-        "lookback_hours": int(os.getenv("LOOKBACK_HOURS", "24"))
+        "lookback_hours": int(os.getenv("LOOKBACK_HOURS", "24")),
+        # Worklogs synced concurrently (network-bound JIRA/Odoo calls)
+        "max_workers": max(1, int(os.getenv("SYNC_MAX_WORKERS", "8")))
     }
 }
 
@@ -48,31 +55,85 @@ def validate_config():
 # Validate configuration on import
 validate_config()
 
+# (connect, read) timeout in seconds for every JIRA/Tempo request
+REQUEST_TIMEOUT = (5, 30)
+
+def make_session(headers, auth=None, pool_connections=1, pool_maxsize=4, methods=("GET",)):
+    """
+    Keep-alive HTTPS session shared by all calls to one API.
+    Retries cover rate limiting and transient gateway errors for the given HTTP methods.
+    """
+    session = requests.Session()
+    session.auth = auth
+    session.headers.update(headers)
+    session.mount("https://", HTTPAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        max_retries=Retry(
+            total=3,
+            backoff_factor=0.3,
+            status_forcelist=[429, 502, 503, 504],
+            allowed_methods=frozenset(methods),
+            raise_on_status=False
+        )
+    ))
+    atexit.register(session.close)
+    return session
+
 def cleanup_old_logs(days_to_keep=7):
     """Remove log files older than specified days"""
     if not os.path.exists("logs"):
         return
     
-    cutoff_date = datetime.now() - timedelta(days=days_to_keep)
-    log_files = glob.glob("logs/*.log")
+    cutoff_ts = (datetime.now() - timedelta(days=days_to_keep)).timestamp()
     
     deleted_count = 0
-    for log_file in log_files:
-        try:
-            file_time = datetime.fromtimestamp(os.path.getmtime(log_file))
-            if file_time < cutoff_date:
-                os.remove(log_file)
-                deleted_count += 1
-        except OSError:
-            continue
+    # Compare raw mtimes from scandir entries instead of globbing and building a datetime per file
+    with os.scandir("logs") as entries:
+        for entry in entries:
+            if not entry.name.endswith(".log"):
+                continue
+            try:
+                if entry.is_file() and entry.stat().st_mtime < cutoff_ts:
+                    os.remove(entry.path)
+                    deleted_count += 1
+            except OSError:
+                continue
     
     if deleted_count > 0:
         logging.info(f"Cleaned up {deleted_count} old log files (older than {days_to_keep} days)")
 
+class BufferedFileHandler(logging.FileHandler):
+    """
+    FileHandler that lets the stream buffer fill instead of flushing every record.
+    Records at flush_level or above are flushed immediately (like MemoryHandler's flushLevel).
+    """
+    
+    buffer_size = 64 * 1024
+    flush_level = logging.ERROR
+    
+    def _open(self):
+        return open(self.baseFilename, self.mode, buffering=self.buffer_size,
+                    encoding=self.encoding, errors=self.errors)
+    
+    def emit(self, record):
+        if self.stream is None:
+            self.stream = self._open()
+        try:
+            self.stream.write(self.format(record) + self.terminator)
+            if record.levelno >= self.flush_level:
+                self.flush()
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+
 class SyncSession:
     def __init__(self):
         self.log_file = None
         self.start_time = None
+        self.log_listener = None
+        self.queue_handler = None
     
     def __enter__(self):
         """Setup logging and email session"""
@@ -97,6 +158,7 @@ class SyncSession:
         
         if exc_type:
             logging.error(f"CRITICAL: Sync session failed: {exc_val}")
+            self.stop_session_logging()
             email_notifier.send_critical_error_immediate(
                 exc_val, 
                 "Sync session failure", 
@@ -105,11 +167,12 @@ class SyncSession:
         else:
             duration = (datetime.now() - self.start_time).total_seconds() if self.start_time else 0
             logging.info(f"=== SYNC SESSION COMPLETED in {duration:.2f} seconds ===")
+            self.stop_session_logging()
         
         return False
     
     def setup_session_logging(self):
-        """Setup logging for this session only"""
+        """Setup logging for this session only, with file/console I/O on a listener thread"""
         if not os.path.exists("logs"):
             os.makedirs("logs")
         
@@ -120,12 +183,45 @@ class SyncSession:
         for handler in logging.root.handlers[:]:
             logging.root.removeHandler(handler)
         
+        # Records never print thread/process/source info, so skip collecting it per record
+        logging.logThreads = False
+        logging.logProcesses = False
+        logging.logMultiprocessing = False
+        logging._srcfile = None
+        
+        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+        file_handler = BufferedFileHandler(self.log_file, encoding='utf-8')
+        stream_handler = logging.StreamHandler()
+        for handler in (file_handler, stream_handler):
+            handler.setFormatter(formatter)
+        
+        # The sync thread only enqueues records; the listener thread does the writes
+        log_queue = queue.Queue(-1)
+        self.log_listener = logging.handlers.QueueListener(
+            log_queue, file_handler, stream_handler, respect_handler_level=True
+        )
+        self.log_listener.start()
+        
+        self.queue_handler = logging.handlers.QueueHandler(log_queue)
+        self.queue_handler.setFormatter(logging.Formatter('%(message)s'))
         logging.basicConfig(
             level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler(self.log_file, encoding='utf-8'),
-                logging.StreamHandler()
-            ],
+            handlers=[self.queue_handler],
             force=True
         )
+    
+    def stop_session_logging(self):
+        """Drain queued log records and flush/close the session log file, keeping console output"""
+        if not self.log_listener:
+            return
+        
+        logging.root.removeHandler(self.queue_handler)
+        self.log_listener.stop()
+        for handler in self.log_listener.handlers:
+            if isinstance(handler, logging.FileHandler):
+                handler.close()
+            else:
+                # Emails are sent after the session - their status lines still reach the console/cron output
+                logging.root.addHandler(handler)
+        self.log_listener = None
+        self.queue_handler = None